@@ -1,10 +1,14 @@
 import os
 import logging
-from typing import Dict, Any, Optional
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from enum import Enum
 from dotenv import load_dotenv
 import pytesseract
-import PyPDF2
+import pypdfium2 as pdfium
 import tabula
 from PIL import Image
 import magic
@@ -19,6 +23,44 @@ class DocumentType(Enum):
     TEXT = "text"
     EXCEL = "excel"
 
+# Shared MIME detector: magic.Magic reloads the MIME database on every
+# instantiation, so construct it once at import time
+_MIME = magic.Magic(mime=True)
+
+# LSTM-only engine, uniform-block segmentation, no inverted-text second pass
+_OCR_CONFIG = '--oem 1 --psm 6 -c tessedit_do_invert=0'
+
+# Cap OCR input size: text recognition gains nothing above ~2000 px wide and
+# tesseract runtime grows quadratically with resolution
+_OCR_MAX_DIMENSION = 2000
+
+_MIME_TYPE_MAP = {
+    'application/pdf': DocumentType.PDF,
+    'image/png': DocumentType.IMAGE,
+    'image/jpeg': DocumentType.IMAGE,
+    'text/plain': DocumentType.TEXT,
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': DocumentType.EXCEL
+}
+
+def _extract_page(file_path: str, page_index: int) -> str:
+    """
+    Extract text from a single PDF page
+
+    Module-level so it can be pickled into ProcessPoolExecutor workers.
+
+    Args:
+        file_path (str): Path to PDF file
+        page_index (int): Zero-based page index
+
+    Returns:
+        str: Extracted page text, empty if the page has none
+    """
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return pdf[page_index].get_textpage().get_text_range() or ''
+    finally:
+        pdf.close()
+
 class AdvancedDocumentProcessor:
     """Main document processor class handling multiple file types"""
     
@@ -32,10 +74,13 @@ class AdvancedDocumentProcessor:
         """
         self.storage_path = storage_path or os.getenv("DOCUMENT_STORAGE_PATH", "data/processed_documents")
         self.log_level = log_level or "INFO"
+        self.enable_tables = os.getenv("ENABLE_TABLE_EXTRACTION", "true").lower() in ("1", "true", "yes")
         
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
             length_function=len,
             is_separator_regex=False
         )
@@ -47,6 +92,13 @@ class AdvancedDocumentProcessor:
         self.logger = logging.getLogger(__name__)
         os.makedirs(self.storage_path, exist_ok=True)
 
+        # Dispatch table built once instead of per process_document call
+        self._dispatch = {
+            DocumentType.PDF: self.process_pdf,
+            DocumentType.IMAGE: self.process_image,
+            DocumentType.TEXT: self.process_text
+        }
+
     def detect_document_type(self, file_path: str) -> DocumentType:
         """
         Detect document type using MIME magic
@@ -61,20 +113,85 @@ class AdvancedDocumentProcessor:
             ValueError: If detection fails
         """
         try:
-            mime = magic.Magic(mime=True)
-            mime_type = mime.from_file(file_path)
-            type_mapping = {
-                'application/pdf': DocumentType.PDF,
-                'image/png': DocumentType.IMAGE,
-                'image/jpeg': DocumentType.IMAGE,
-                'text/plain': DocumentType.TEXT,
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': DocumentType.EXCEL
-            }
-            return type_mapping.get(mime_type, DocumentType.TEXT)
+            mime_type = _MIME.from_file(file_path)
+            return _MIME_TYPE_MAP.get(mime_type, DocumentType.TEXT)
         except Exception as e:
             self.logger.error(f"Type detection error: {e}")
             raise ValueError("Failed to detect document type") from e
 
+    def _extract_text(self, file_path: str) -> Tuple[List[str], int]:
+        """
+        Extract and chunk PDF text page by page
+
+        Args:
+            file_path (str): Path to PDF file
+
+        Returns:
+            Tuple[List[str], int]: Text chunks and page count
+        """
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            page_count = len(pdf)
+        finally:
+            pdf.close()
+
+        if page_count > 1:
+            # Tesseract/PyPDF2 guidance favors multiple single-threaded
+            # processes over intra-process threading
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+            # process_pdf calls this from a ThreadPoolExecutor worker, so the
+            # default fork start method could deadlock children on locks
+            # inherited from the live tabula thread; forkserver spawns from a
+            # clean single-threaded parent
+            with ProcessPoolExecutor(
+                max_workers=min(page_count, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("forkserver")
+            ) as executor:
+                chunks = self._split_pages(executor.map(partial(_extract_page, file_path), range(page_count)))
+        else:
+            # Fork overhead isn't worth it for a single page
+            chunks = self._split_pages(_extract_page(file_path, index) for index in range(page_count))
+        return chunks, page_count
+
+    def _split_pages(self, pages: Iterable[str]) -> List[str]:
+        """
+        Chunk a stream of page texts with a rolling overlap tail
+
+        Args:
+            pages (Iterable[str]): Page texts in document order
+
+        Returns:
+            List[str]: Text chunks across all pages
+        """
+        chunks = []
+        tail = ''
+        # Split page by page with a rolling overlap tail so the full
+        # document text is never materialized in one buffer
+        for page_text in pages:
+            if not page_text:
+                continue
+            window = f"{tail}\n{page_text}" if tail else page_text
+            chunks.extend(self.text_splitter.split_text(window))
+            tail = window[-self.chunk_overlap:]
+        return chunks
+
+    def _extract_tables(self, file_path: str) -> List[Dict]:
+        """
+        Extract PDF tables via tabula
+
+        Args:
+            file_path (str): Path to PDF file
+
+        Returns:
+            List[Dict]: Extracted table records, empty on failure
+        """
+        try:
+            tables = tabula.read_pdf(file_path, pages='all', multiple_tables=True)
+            return [table.to_dict('records') for table in tables if not table.empty]
+        except Exception as e:
+            self.logger.warning(f"Table extraction failed: {e}")
+            return []
+
     def process_pdf(self, file_path: str) -> Dict[str, Any]:
         """
         Process PDF document with text and table extraction
@@ -89,26 +206,18 @@ class AdvancedDocumentProcessor:
             RuntimeError: If PDF processing fails
         """
         try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text_pages = [page.extract_text() for page in reader.pages]
-            
-            full_text = '\n'.join(text_pages)
-            chunks = self.text_splitter.split_text(full_text)
-            
-            # Extract tables
-            processed_tables = []
-            try:
-                tables = tabula.read_pdf(file_path, pages='all', multiple_tables=True)
-                processed_tables = [table.to_dict('records') for table in tables if not table.empty]
-            except Exception as e:
-                self.logger.warning(f"Table extraction failed: {e}")
+            # Run text extraction and the tabula JVM call concurrently so the
+            # JVM spin-up overlaps with the Python-side page scan
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                text_future = executor.submit(self._extract_text, file_path)
+                tables_future = executor.submit(self._extract_tables, file_path) if self.enable_tables else None
+                chunks, page_count = text_future.result()
+                processed_tables = tables_future.result() if tables_future else []
 
             return {
-                'text': full_text,
                 'chunks': chunks,
                 'tables': processed_tables,
-                'page_count': len(reader.pages),
+                'page_count': page_count,
                 'total_chunks': len(chunks)
             }
         except Exception as e:
@@ -129,20 +238,104 @@ class AdvancedDocumentProcessor:
             RuntimeError: If image processing fails
         """
         try:
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
             image = Image.open(file_path)
-            text = pytesseract.image_to_string(image) or ""
+            image_format, image_mode = image.format, image.mode
+            # Grayscale and downscale before OCR: less pixel data for the
+            # same recognizable text
+            ocr_image = image.convert('L')
+            ocr_image.thumbnail((_OCR_MAX_DIMENSION, _OCR_MAX_DIMENSION), Image.LANCZOS)
+            text = pytesseract.image_to_string(ocr_image, config=_OCR_CONFIG) or ""
             chunks = self.text_splitter.split_text(text)
             return {
-                'text': text,
                 'chunks': chunks,
-                'format': image.format,
-                'mode': image.mode,
+                'format': image_format,
+                'mode': image_mode,
                 'total_chunks': len(chunks)
             }
         except Exception as e:
             self.logger.error(f"Image processing error: {e}")
             raise RuntimeError("Image processing failed") from e
 
+    def process_images_batch(self, file_paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Process multiple images with a single tesseract invocation
+
+        Tesseract accepts a text file listing image paths and OCRs them all
+        in one process, avoiding the per-image engine init that dominates
+        small images.
+
+        Args:
+            file_paths (List[str]): Paths to image files
+
+        Returns:
+            List[Dict[str, Any]]: Processed OCR data per image, in input order
+
+        Raises:
+            RuntimeError: If batch image processing fails
+        """
+        if len(file_paths) == 1:
+            result = self.process_image(file_paths[0])
+            result['filename'] = os.path.basename(file_paths[0])
+            result['file_type'] = DocumentType.IMAGE.value
+            return [result]
+        try:
+            # Tesseract's own OpenMP threading is net-negative; keep each
+            # invocation single-threaded
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+            # Preprocess each image the same way process_image does, so an
+            # image OCRs identically whether uploaded alone or in a batch
+            temp_paths = []
+            image_infos = []
+            try:
+                for file_path in file_paths:
+                    with Image.open(file_path) as image:
+                        image_infos.append((image.format, image.mode))
+                        ocr_image = image.convert('L')
+                        ocr_image.thumbnail((_OCR_MAX_DIMENSION, _OCR_MAX_DIMENSION), Image.LANCZOS)
+                        fd, temp_path = tempfile.mkstemp(suffix='.png')
+                        os.close(fd)
+                        ocr_image.save(temp_path)
+                        temp_paths.append(temp_path)
+
+                with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as list_file:
+                    list_file.write('\n'.join(temp_paths))
+                    list_path = list_file.name
+                try:
+                    combined = pytesseract.image_to_string(list_path, config=_OCR_CONFIG) or ""
+                finally:
+                    os.remove(list_path)
+            finally:
+                for temp_path in temp_paths:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+            # Tesseract separates per-image output with form feeds; pad if it
+            # emitted fewer segments than images so zip can't misattribute
+            # one image's text to another
+            texts = combined.split('\f')
+            if len(texts) < len(file_paths):
+                self.logger.warning(
+                    f"OCR returned {len(texts)} segments for {len(file_paths)} images; padding with empty text"
+                )
+                texts.extend([''] * (len(file_paths) - len(texts)))
+            results = []
+            for file_path, (image_format, image_mode), text in zip(file_paths, image_infos, texts):
+                chunks = self.text_splitter.split_text(text)
+                results.append({
+                    'chunks': chunks,
+                    'format': image_format,
+                    'mode': image_mode,
+                    'total_chunks': len(chunks),
+                    'filename': os.path.basename(file_path),
+                    'file_type': DocumentType.IMAGE.value
+                })
+            return results
+        except Exception as e:
+            self.logger.error(f"Batch image processing error: {e}")
+            raise RuntimeError("Batch image processing failed") from e
+
     def process_text(self, file_path: str) -> Dict[str, Any]:
         """
         Process plain text file
@@ -161,7 +354,6 @@ class AdvancedDocumentProcessor:
                 text = f.read()
             chunks = self.text_splitter.split_text(text)
             return {
-                'text': text,
                 'chunks': chunks,
                 'total_chunks': len(chunks)
             }
@@ -183,15 +375,11 @@ class AdvancedDocumentProcessor:
             ValueError: For unsupported document types
         """
         doc_type = self.detect_document_type(file_path)
-        processor = {
-            DocumentType.PDF: self.process_pdf,
-            DocumentType.IMAGE: self.process_image,
-            DocumentType.TEXT: self.process_text
-        }.get(doc_type, None)
-        
-        if not processor:
-            raise ValueError(f"Unsupported document type: {doc_type}")
-        
+        try:
+            processor = self._dispatch[doc_type]
+        except KeyError:
+            raise ValueError(f"Unsupported document type: {doc_type}") from None
+
         result = processor(file_path)
         result['filename'] = os.path.basename(file_path)
         result['file_type'] = doc_type.value
@@ -1,12 +1,46 @@
+import json
 import logging
-from typing import List, Optional, Dict, Any
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple
 import os
+import numpy as np
 from dotenv import load_dotenv
 import chromadb
-from sentence_transformers import SentenceTransformer
+import hnswlib
+from numba import njit
+import onnxruntime
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from transformers import AutoTokenizer
 
 load_dotenv()
 
+@njit(nogil=True, cache=True, fastmath=True)
+def _topk_cosine(mat, q, k):
+    """
+    Exact top-k cosine scores over an int8 matrix
+
+    Compiled with nogil so concurrent requests don't serialize on the GIL
+    and cache=True so the compile cost is paid once per machine.
+
+    Args:
+        mat (int8[:, :]): Quantized candidate vectors, one per row
+        q (int8[:]): Quantized query vector
+        k (int): Number of results
+
+    Returns:
+        tuple: (row indices, cosine similarities) sorted best-first
+    """
+    n, dim = mat.shape
+    scores = np.empty(n, dtype=np.float32)
+    for i in range(n):
+        acc = np.int32(0)
+        for j in range(dim):
+            acc += np.int32(mat[i, j]) * np.int32(q[j])
+        scores[i] = acc / np.float32(127.0 * 127.0)
+    order = np.argsort(-scores)[:k]
+    return order, scores[order]
+
 class EmbeddingService:
     """Service for managing document embeddings"""
     
@@ -24,35 +58,292 @@ class EmbeddingService:
         """
         self.embedding_model = embedding_model or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
         self.vector_db_path = vector_db_path or os.getenv("VECTOR_DB_PATH", "./vectordb")
-        
+        self.onnx_path = os.path.join(self.vector_db_path, "onnx")
+        self.index_path = os.path.join(self.vector_db_path, "hnsw_index.bin")
+        self.index_ids_path = os.path.join(self.vector_db_path, "hnsw_ids.json")
+
+        # HNSW build/query knobs, tunable via env without a code edit
+        self.hnsw_m = int(os.getenv("HNSW_M", "24"))
+        self.hnsw_construction_ef = int(os.getenv("HNSW_CONSTRUCTION_EF", "128"))
+        self.hnsw_search_ef = int(os.getenv("HNSW_SEARCH_EF", "100"))
+        self.default_top_k = int(os.getenv("TOP_K_RETRIEVAL", "5"))
+        self.brute_force_threshold = int(os.getenv("BRUTE_FORCE_THRESHOLD", "10000"))
+
         self.logger = logging.getLogger(__name__)
         try:
-            self.model = SentenceTransformer(self.embedding_model)
+            self.tokenizer, self.session = self._load_onnx_model()
+            # Fixed-shape input buffers for the query path: reusing the same
+            # arrays and shapes on every call lets ONNX Runtime keep its
+            # allocation plan instead of re-planning per request
+            self._max_seq_len = int(os.getenv("EMBEDDING_MAX_SEQ_LEN", "128"))
+            self._query_inputs = {
+                name: np.zeros((1, self._max_seq_len), dtype=np.int64)
+                for name in self._input_names
+            }
             self.chroma_client = chromadb.PersistentClient(path=self.vector_db_path)
-            self.collection = self.chroma_client.get_or_create_collection(
-                name="document_embeddings",
-                metadata={"hnsw:space": "cosine"}
-            )
+            self.collection = self._get_collection()
+            self._index = self._load_index()
+            # Per-instance memo of query embeddings: repeated questions skip
+            # the transformer forward pass entirely
+            cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+            self._encode_query_cached = lru_cache(maxsize=cache_size)(self._encode_query)
+            self._warmup()
             self.logger.info(f"Initialized embedding service with model: {self.embedding_model}")
         except Exception as e:
             self.logger.error(f"Initialization failed: {e}")
             raise
 
-    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _load_onnx_model(self):
+        """
+        Export, quantize and load the embedding model through ONNX Runtime
+
+        The model is exported to ONNX once, dynamically quantized to INT8 and
+        cached under `vector_db_path/onnx`; subsequent startups load the cached
+        artifacts directly.
+
+        Returns:
+            tuple: (tokenizer, onnxruntime.InferenceSession)
+        """
+        model_id = self.embedding_model
+        if "/" not in model_id:
+            model_id = f"sentence-transformers/{model_id}"
+        quantized_path = os.path.join(self.onnx_path, "model_quantized.onnx")
+
+        if not os.path.exists(quantized_path):
+            os.makedirs(self.onnx_path, exist_ok=True)
+            exported = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+            exported.save_pretrained(self.onnx_path)
+            quantize_dynamic(
+                os.path.join(self.onnx_path, "model.onnx"),
+                quantized_path,
+                weight_type=QuantType.QInt8
+            )
+            self.logger.info(f"Exported quantized ONNX model to {self.onnx_path}")
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Prefer the CUDA provider when the GPU build of onnxruntime is present
+        providers = ["CPUExecutionProvider"]
+        if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        session = onnxruntime.InferenceSession(
+            quantized_path,
+            sess_options=sess_options,
+            providers=providers
+        )
+        self._input_names = {inp.name for inp in session.get_inputs()}
+        self._dim = int(session.get_outputs()[0].shape[-1])
+        return tokenizer, session
+
+    def _get_collection(self):
+        """
+        Create or migrate the Chroma collection with tuned HNSW parameters
+
+        Chroma's defaults (M=16, ef_construction=100, ef_search=10) trade
+        recall for build speed; a collection created with defaults is rebuilt
+        once by re-adding its records under the tuned parameters.
+
+        Returns:
+            chromadb.Collection: Collection with tuned index metadata
+        """
+        metadata = {
+            "hnsw:space": "cosine",
+            "hnsw:M": self.hnsw_m,
+            "hnsw:construction_ef": self.hnsw_construction_ef,
+            "hnsw:search_ef": self.hnsw_search_ef,
+            "hnsw:batch_size": 256,
+            "hnsw:sync_threshold": 1000
+        }
+        try:
+            existing = self.chroma_client.get_collection(name="document_embeddings")
+        except Exception:
+            return self.chroma_client.create_collection(name="document_embeddings", metadata=metadata)
+
+        # Only build-time parameters force re-adding every record; query- and
+        # write-path knobs (search_ef, batch_size, sync_threshold) apply
+        # through a plain metadata update
+        build_keys = ("hnsw:space", "hnsw:M", "hnsw:construction_ef")
+        existing_metadata = existing.metadata or {}
+        if all(existing_metadata.get(key) == metadata[key] for key in build_keys):
+            if any(existing_metadata.get(key) != value for key, value in metadata.items()):
+                existing.modify(metadata=metadata)
+            return existing
+
+        # One-shot migration: rebuild the collection under the tuned parameters
+        records = existing.get(include=["embeddings", "documents", "metadatas"])
+        self.chroma_client.delete_collection(name="document_embeddings")
+        collection = self.chroma_client.create_collection(name="document_embeddings", metadata=metadata)
+        if records["ids"]:
+            collection.add(
+                ids=records["ids"],
+                embeddings=records["embeddings"],
+                documents=records["documents"],
+                metadatas=records["metadatas"]
+            )
+            self.logger.info(f"Migrated {len(records['ids'])} records to tuned HNSW collection")
+        return collection
+
+    def _load_index(self) -> hnswlib.Index:
+        """
+        Load the HNSW index from disk, or rebuild it from the collection
+
+        The index answers top-k queries in process with SIMD cosine distance;
+        ChromaDB stays the durable store for documents and metadata.
+
+        Returns:
+            hnswlib.Index: Ready-to-query index
+        """
+        if os.path.exists(self.index_path) and os.path.exists(self.index_ids_path):
+            index = hnswlib.Index(space='cosine', dim=self._dim)
+            index.load_index(self.index_path, allow_replace_deleted=False)
+            with open(self.index_ids_path, 'r', encoding='utf-8') as f:
+                self._index_ids = json.load(f)
+            if self._load_vector_cache():
+                index.set_ef(self.hnsw_search_ef)
+                self._index_id_set = set(self._index_ids)
+                return index
+            # The side files reference ids the collection no longer has
+            # (wiped store, older backup): discard them and rebuild below
+            self.logger.warning("HNSW side index out of sync with collection, rebuilding")
+            os.remove(self.index_path)
+            os.remove(self.index_ids_path)
+
+        index = hnswlib.Index(space='cosine', dim=self._dim)
+        index.init_index(max_elements=10000, ef_construction=self.hnsw_construction_ef, M=self.hnsw_m)
+        self._index_ids = []
+        existing = self.collection.get(include=["embeddings"])
+        if existing["ids"]:
+            vectors = np.asarray(existing["embeddings"], dtype=np.float32)
+            if len(vectors) > index.get_max_elements():
+                index.resize_index(len(vectors))
+            index.add_items(vectors, np.arange(len(vectors)))
+            self._index_ids = list(existing["ids"])
+            self.logger.info(f"Rebuilt HNSW index with {len(vectors)} vectors")
+        index.set_ef(self.hnsw_search_ef)
+        self._index_id_set = set(self._index_ids)
+        self._load_vector_cache()
+        return index
+
+    @staticmethod
+    def _quantize(vectors) -> np.ndarray:
+        """Scalar-quantize L2-normalized vectors to int8 (scale 127)"""
+        return np.round(np.asarray(vectors, dtype=np.float32) * 127.0).clip(-128, 127).astype(np.int8)
+
+    def _load_vector_cache(self) -> bool:
+        """
+        Build the in-memory vector matrices from stored embeddings
+
+        Vectors are kept in HNSW label order so index candidates map straight
+        to matrix rows. `_qvecs` (int8) backs candidate rescoring at any
+        scale; `_vecs` (contiguous float32) backs exhaustive BLAS search and
+        is only kept while the collection is below `brute_force_threshold`.
+
+        Returns:
+            bool: False if the id map references records the collection
+                no longer holds (stale side index), True otherwise
+        """
+        if not self._index_ids:
+            self._qvecs = np.empty((0, self._dim), dtype=np.int8)
+            self._vecs = np.empty((0, self._dim), dtype=np.float32)
+            return True
+        records = self.collection.get(ids=self._index_ids, include=["embeddings"])
+        row_for_id = {record_id: row for row, record_id in enumerate(records["ids"])}
+        if any(record_id not in row_for_id for record_id in self._index_ids):
+            return False
+        vectors = np.asarray(records["embeddings"], dtype=np.float32)
+        vectors = np.ascontiguousarray(vectors[[row_for_id[record_id] for record_id in self._index_ids]])
+        self._qvecs = self._quantize(vectors)
+        self._vecs = vectors if len(vectors) <= self.brute_force_threshold else None
+        return True
+
+    def _index_add(self, embeddings: List[List[float]], ids: List[str]):
+        """Add new vectors to the HNSW index and persist it alongside the id map"""
+        # Chroma's upsert dedupes by id; mirror that here so a retried
+        # document doesn't append duplicate rows to the side index. Ids embed
+        # the content hash, so an already-indexed id carries the same vector.
+        fresh = [row for row, record_id in enumerate(ids) if record_id not in self._index_id_set]
+        if not fresh:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)[fresh]
+        ids = [ids[row] for row in fresh]
+        start = len(self._index_ids)
+        if start + len(vectors) > self._index.get_max_elements():
+            self._index.resize_index(max(start + len(vectors), 2 * self._index.get_max_elements()))
+        self._index.add_items(vectors, np.arange(start, start + len(vectors)))
+        self._index_ids.extend(ids)
+        self._index_id_set.update(ids)
+        self._qvecs = np.vstack([self._qvecs, self._quantize(vectors)])
+        if self._vecs is not None:
+            if len(self._index_ids) <= self.brute_force_threshold:
+                self._vecs = np.ascontiguousarray(np.vstack([self._vecs, vectors]))
+            else:
+                self._vecs = None
+        self._index.save_index(self.index_path)
+        with open(self.index_ids_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index_ids, f)
+
+    @staticmethod
+    def _mean_pool(last_hidden_state: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Mean-pool token embeddings with attention-mask weighting, then L2-normalize"""
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        counts = mask.sum(axis=1).clip(min=1e-9)
+        embeddings = summed / counts
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        return embeddings / norms
+
+    def _warmup(self, batch_size: int = 64):
+        """Prime tokenizer and inference kernels with a dummy batch"""
+        try:
+            self._encode_batch(["warmup"] * batch_size)
+            self._encode_query("warmup")
+            # Trigger (or load the cached) numba compile before first request
+            _topk_cosine(np.zeros((2, self._dim), dtype=np.int8), np.zeros(self._dim, dtype=np.int8), 1)
+        except Exception as e:
+            self.logger.warning(f"Warmup failed: {e}")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Tokenize one batch, run the ONNX session and pool the output"""
+        encoded = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        inputs = {k: v for k, v in encoded.items() if k in self._input_names}
+        last_hidden_state = self.session.run(None, inputs)[0]
+        return self._mean_pool(last_hidden_state, encoded["attention_mask"])
+
+    def _encode_query(self, query: str) -> List[float]:
+        """Encode a single query through the pre-allocated fixed-shape buffers"""
+        encoded = self.tokenizer(
+            query,
+            padding='max_length',
+            truncation=True,
+            max_length=self._max_seq_len,
+            return_tensors='np'
+        )
+        for name, buffer in self._query_inputs.items():
+            np.copyto(buffer, encoded[name])
+        last_hidden_state = self.session.run(None, self._query_inputs)[0]
+        return self._mean_pool(last_hidden_state, self._query_inputs["attention_mask"])[0].tolist()
+
+    def create_embeddings(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
         """
         Generate embeddings for text chunks
-        
+
         Args:
             texts (List[str]): List of text chunks to embed
-        
+            batch_size (int): Number of chunks encoded per inference call
+
         Returns:
             List[List[float]]: List of embedding vectors
-        
+
         Raises:
             RuntimeError: If embedding generation fails
         """
         try:
-            return self.model.encode(texts).tolist()
+            embeddings = []
+            for start in range(0, len(texts), batch_size):
+                batch = texts[start:start + batch_size]
+                embeddings.extend(self._encode_batch(batch).tolist())
+            return embeddings
         except Exception as e:
             self.logger.error(f"Embedding generation failed: {e}")
             raise RuntimeError("Embedding creation failed") from e
@@ -77,46 +368,101 @@ class EmbeddingService:
             RuntimeError: If storage operation fails
         """
         try:
-            embeddings = embeddings or self.create_embeddings(texts)
+            # One large batch per document amortizes kernel launch overhead
+            embeddings = embeddings or self.create_embeddings(texts, batch_size=min(128, max(1, len(texts))))
             metadatas = metadatas or [{} for _ in texts]
             ids = [f"{unique_id}_chunk_{i}" for i in range(len(texts))] if unique_id else [f"chunk_{i}" for i in range(len(texts))]
             
-            self.collection.add(
-                embeddings=embeddings,
+            # upsert keeps a retried document from raising on duplicate ids
+            # and re-running the embedding pass
+            self.collection.upsert(
+                embeddings=np.asarray(embeddings, dtype=np.float32),
                 documents=texts,
                 metadatas=metadatas,
                 ids=ids
             )
+            self._index_add(embeddings, ids)
             self.logger.info(f"Stored {len(texts)} chunks from {unique_id or 'unknown'}")
         except Exception as e:
             self.logger.error(f"Storage failed: {e}")
             raise RuntimeError("Embedding storage failed") from e
 
-    def search_embeddings(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def _search_brute_force(self, query_embedding: np.ndarray, top_k: int) -> Tuple[List[str], List[float]]:
+        """
+        Exhaustive cosine search over the float32 matrix via BLAS
+
+        Below `brute_force_threshold` vectors, a single SGEMV over the
+        contiguous matrix beats a graph walk and is exact.
+
+        Args:
+            query_embedding (np.ndarray): (1, dim) normalized query vector
+            top_k (int): Number of results
+
+        Returns:
+            Tuple[List[str], List[float]]: Matched ids and cosine distances
+        """
+        scores = self._vecs @ query_embedding[0]
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [self._index_ids[i] for i in top], [1.0 - float(scores[i]) for i in top]
+
+    def _search_index(self, query_embedding: np.ndarray, top_k: int) -> Tuple[List[str], List[float]]:
+        """
+        Approximate search via HNSW with exact int8 rescoring
+
+        Over-fetches 3x top_k candidates from the graph, then reorders them
+        with an int8 dot product against the quantized matrix.
+
+        Args:
+            query_embedding (np.ndarray): (1, dim) normalized query vector
+            top_k (int): Number of results
+
+        Returns:
+            Tuple[List[str], List[float]]: Matched ids and cosine distances
+        """
+        candidate_k = min(top_k * 3, len(self._index_ids))
+        labels, _ = self._index.knn_query(query_embedding, k=candidate_k)
+        candidates = labels[0]
+        quantized_query = self._quantize(query_embedding)[0]
+        top, scores = _topk_cosine(np.ascontiguousarray(self._qvecs[candidates]), quantized_query, top_k)
+        ids = [self._index_ids[candidates[i]] for i in top]
+        return ids, [1.0 - float(score) for score in scores]
+
+    def search_embeddings(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Perform semantic search on stored embeddings
-        
+
         Args:
             query (str): Search query text
-            top_k (int): Number of results to return
-        
+            top_k (Optional[int]): Number of results to return (default: TOP_K_RETRIEVAL env)
+
         Returns:
             List[Dict[str, Any]]: Search results with metadata
-        
+
         Raises:
             RuntimeError: If search operation fails
         """
         try:
-            query_embedding = self.create_embeddings([query])[0]
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k
-            )
+            top_k = top_k or self.default_top_k
+            if not self._index_ids:
+                return []
+            # The model is uncased, so lowercasing widens cache hits for free
+            query_embedding = np.asarray([self._encode_query_cached(query.strip().lower())], dtype=np.float32)
+            if self._vecs is not None:
+                ids, distances = self._search_brute_force(query_embedding, top_k)
+            else:
+                ids, distances = self._search_index(query_embedding, top_k)
+            records = self.collection.get(ids=ids, include=["documents", "metadatas"])
+            by_id = {
+                record_id: (doc, meta)
+                for record_id, doc, meta in zip(records['ids'], records['documents'], records['metadatas'])
+            }
             return [{
-                "text": doc,
+                "text": by_id[record_id][0],
                 "distance": dist,
-                "metadata": meta
-            } for doc, dist, meta in zip(results['documents'][0], results['distances'][0], results['metadatas'][0])]
+                "metadata": by_id[record_id][1]
+            } for record_id, dist in zip(ids, distances)]
         except Exception as e:
             self.logger.error(f"Search failed: {e}")
             raise RuntimeError("Embedding search failed") from e
\ No newline at end of file
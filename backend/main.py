@@ -1,16 +1,22 @@
 from fastapi import FastAPI, File, UploadFile, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Tuple
+import asyncio
+import logging
 import os
-import hashlib 
+import hashlib
+import tempfile
+import aiofiles
 from dotenv import load_dotenv
-from backend.document_processor import AdvancedDocumentProcessor
+from backend.document_processor import AdvancedDocumentProcessor, DocumentType
 from backend.embedding import EmbeddingService
 from backend.model import LangChainQAService
 from pydantic import BaseModel
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Multi-Modal Document Processing API",
     description="Advanced document processing and Q&A system",
@@ -37,54 +43,102 @@ qa_service = LangChainQAService(api_key)
 class QueryModel(BaseModel):
     query: str
 
-async def process_document_async(filename: str, content: bytes):
-    """Process document and store embeddings"""
-    temp_path = os.path.join(document_storage_path, filename)
-    try:
-        # Save uploaded file temporarily
-        with open(temp_path, 'wb') as buffer:
-            buffer.write(content)
+async def _spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """Stream one upload to disk in 1 MiB chunks, hashing incrementally"""
+    # Unique temp name: two same-named files in one batch must not
+    # interleave writes to a shared path
+    fd, temp_path = tempfile.mkstemp(
+        dir=document_storage_path,
+        suffix=os.path.splitext(file.filename or '')[1]
+    )
+    os.close(fd)
+    hasher = hashlib.sha256()
+    async with aiofiles.open(temp_path, 'wb') as buffer:
+        while chunk := await file.read(1 << 20):
+            hasher.update(chunk)
+            await buffer.write(chunk)
+    return temp_path, hasher.hexdigest()
+
+def _store_chunks(filename: str, file_type: str, file_hash: str, chunks: List[str]):
+    """Embed and store a document's chunks under its content-hash id"""
+    unique_id = f"{filename}_{file_hash}"
+    metadatas = [{
+        'filename': filename,
+        'file_type': file_type,
+        'chunk_index': i
+    } for i in range(len(chunks))]
+    embedding_service.store_embeddings(
+        texts=chunks,
+        metadatas=metadatas,
+        unique_id=unique_id
+    )
 
+async def process_document_async(filename: str, file_path: str, file_hash: str):
+    """Process an already-spooled document and store embeddings"""
+    try:
         # Process document and split into chunks
-        processed_doc = doc_processor.process_document(temp_path)
+        processed_doc = doc_processor.process_document(file_path)
         chunks = processed_doc.get('chunks', [])
-        
+
         if not chunks:
             raise ValueError("No text chunks generated from document")
 
-        # Generate unique ID from content hash
-        file_hash = hashlib.sha256(content).hexdigest()
-        unique_id = f"{filename}_{file_hash}"
-        
-        # Prepare metadata for each chunk
-        metadatas = [{
-            'filename': filename,
-            'file_type': processed_doc['file_type'],
-            'chunk_index': i
-        } for i in range(len(chunks))]
-
-        # Store embeddings for all chunks
-        embedding_service.store_embeddings(
-            texts=chunks,
-            metadatas=metadatas,
-            unique_id=unique_id
-        )
+        _store_chunks(filename, processed_doc['file_type'], file_hash, chunks)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Document processing failed: {str(e)}")
     finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+async def process_images_batch_async(uploads: List[Tuple[str, str, str]]):
+    """OCR a batch of spooled images in one pass and store embeddings"""
+    file_paths = [file_path for _, file_path, _ in uploads]
+    try:
+        processed_docs = doc_processor.process_images_batch(file_paths)
+        for (filename, _, file_hash), processed_doc in zip(uploads, processed_docs):
+            # Keep each image its own failure domain: one blank scan must
+            # not discard the rest of the batch
+            try:
+                chunks = processed_doc.get('chunks', [])
+                if not chunks:
+                    raise ValueError("No text chunks generated from document")
+                _store_chunks(filename, processed_doc['file_type'], file_hash, chunks)
+            except Exception as e:
+                logger.error(f"Processing failed for {filename}: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Document processing failed: {str(e)}")
+    finally:
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
 @app.post("/upload/batch")
 async def batch_upload(
-    background_tasks: BackgroundTasks, 
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...)
 ):
+    # Spool all uploads concurrently so endpoint latency tracks the largest
+    # file rather than the sum of all files
+    spooled = await asyncio.gather(*(_spool_upload(file) for file in files))
     results = []
-    for file in files:
-        content = await file.read()
-        background_tasks.add_task(process_document_async, file.filename, content)
+    image_uploads = []
+    for file, (temp_path, file_hash) in zip(files, spooled):
+        try:
+            is_image = doc_processor.detect_document_type(temp_path) == DocumentType.IMAGE
+        except ValueError:
+            is_image = False
+        if is_image:
+            # Collect images so one tesseract invocation OCRs them all
+            image_uploads.append((file.filename, temp_path, file_hash))
+        else:
+            background_tasks.add_task(process_document_async, file.filename, temp_path, file_hash)
         results.append({"filename": file.filename, "status": "queued"})
+
+    if len(image_uploads) > 1:
+        background_tasks.add_task(process_images_batch_async, image_uploads)
+    elif image_uploads:
+        filename, temp_path, file_hash = image_uploads[0]
+        background_tasks.add_task(process_document_async, filename, temp_path, file_hash)
     return {"message": "Documents queued for processing", "results": results}
 
 @app.post("/ask")
@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 
 load_dotenv()
 
@@ -40,6 +39,9 @@ class LangChainQAService:
         
         Helpful Answer:""")
 
+        # Build the chain once; per-call invocations only inject inputs
+        self._chain = self.qa_prompt | self.llm | StrOutputParser()
+
         print("LangChain QA Service initialized successfully.")
 
     def generate_answer(
@@ -64,14 +66,7 @@ class LangChainQAService:
 
             print(f"Context Text: {context_text}")
 
-            rag_chain = (
-                {"context": lambda x: context_text, "question": RunnablePassthrough()}
-                | self.qa_prompt
-                | self.llm
-                | StrOutputParser()
-            )
-
-            response = rag_chain.invoke(query)
+            response = self._chain.invoke({"context": context_text, "question": query})
             return response
 
         except Exception as e: